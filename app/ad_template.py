@@ -0,0 +1,161 @@
+import hashlib
+import json
+from copy import deepcopy
+from typing import Dict, List, Optional
+
+import yaml
+
+from app.common import ROOT_DIR, get_cfg
+from app.helpers import safe_int
+
+# ----------------------------
+# Ad profile (shared defaults) and rendering
+# ----------------------------
+# A pending ad is rendered from the shared profile plus the ad's own values
+# (its overrides). Empty values in the overrides inherit from the profile's
+# `defaults`, and the profile's `description_suffix` is appended to every
+# description, so contact info, shipping options or the disclaimer can be
+# changed for all ads in one place.
+
+PROFILE_PATH = (ROOT_DIR / get_cfg("ad_profile", "ad_profile.yaml")).resolve()
+PROFILE_TEMPLATE_PATH = ROOT_DIR / "ad_profile.yaml.template"
+
+
+def load_profile() -> Dict:
+    path = PROFILE_PATH if PROFILE_PATH.exists() else PROFILE_TEMPLATE_PATH
+    if not path.exists():
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return yaml.safe_load(f) or {}
+
+
+def profile_digest() -> str:
+    # Identifies the profile content the pending ads were last rendered from
+    path = PROFILE_PATH if PROFILE_PATH.exists() else PROFILE_TEMPLATE_PATH
+    return hashlib.sha256(path.read_bytes() if path.exists() else b"").hexdigest()
+
+
+def save_profile(profile: Dict):
+    tmp = PROFILE_PATH.with_name(PROFILE_PATH.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        yaml.safe_dump(profile, f, sort_keys=False, allow_unicode=True)
+    tmp.replace(PROFILE_PATH)
+
+
+def _is_unset(v) -> bool:
+    return v is None or v == "" or v == [] or v == {}
+
+
+def with_defaults(md: Dict, defaults: Dict) -> Dict:
+    out = dict(md)
+    for k, dv in defaults.items():
+        v = out.get(k)
+        if isinstance(v, dict) and isinstance(dv, dict):
+            out[k] = with_defaults(v, dv)
+        elif _is_unset(v):
+            out[k] = deepcopy(dv)
+    return out
+
+
+def apply_patch(md: Dict, set_: Dict, unset: List[str]) -> Dict:
+    # Dicts in `set_` are merged, other values replace; `unset` takes dotted keys
+    out = deepcopy(md)
+    for k, v in set_.items():
+        if isinstance(v, dict) and isinstance(out.get(k), dict):
+            out[k] = apply_patch(out[k], v, [])
+        else:
+            out[k] = deepcopy(v)
+    for key in unset:
+        parts = key.split(".")
+        d = out
+        for p in parts[:-1]:
+            d = d.get(p) if isinstance(d, dict) else None
+        if isinstance(d, dict):
+            d.pop(parts[-1], None)
+    return out
+
+
+# Every key build_ad may write. Anything else in an ad YAML (e.g. the id and
+# timestamps kleinanzeigen-bot adds when it publishes) is kept on re-render.
+RENDERED_KEYS = {
+    "active", "type", "title", "description", "category", "price", "price_type", "shipping_type",
+    "shipping_costs", "shipping_options", "sell_directly", "contact", "special_attributes",
+    "republication_interval", "images",
+}
+
+
+def build_ad(md: Dict) -> Dict:
+    ad = {}
+    ad["active"] = True
+    ad["type"] = (md.get("type") or "OFFER").strip().upper()
+    ad["title"] = (md.get("title") or "").strip()
+    ad["description"] = (md.get("description") or "").strip()
+    ad["category"] = (md.get("category") or "").strip()
+
+    price = safe_int(md.get("price"), None)
+    if price is not None:
+        ad["price"] = price
+    ad["price_type"] = (md.get("price_type") or "NEGOTIABLE").strip().upper()
+
+    ship_type = (md.get("shipping_type") or "SHIPPING").strip().upper()
+    ad["shipping_type"] = ship_type
+    if md.get("shipping_costs") not in (None, ""):
+        ad["shipping_costs"] = float(md["shipping_costs"])
+    shipping_options = md.get("shipping_options") or []
+    if isinstance(shipping_options, str):
+        shipping_options = [s.strip() for s in shipping_options.split(",") if s.strip()]
+    ad["shipping_options"] = shipping_options
+    sd = md.get("sell_directly")
+    if sd is not None:
+        ad["sell_directly"] = bool(sd)
+
+    contact = md.get("contact") or {}
+    ad["contact"] = {
+        "name": contact.get("name", ""),
+        "street": contact.get("street", ""),
+        "zipcode": str(contact.get("zipcode", "")) if contact.get("zipcode") is not None else "",
+        "phone": str(contact.get("phone", "")) if contact.get("phone") is not None else "",
+    }
+
+    sa = md.get("special_attributes")
+    if isinstance(sa, dict):
+        ad["special_attributes"] = sa
+    else:
+        # try to parse JSON string
+        if isinstance(sa, str) and sa.strip():
+            try:
+                obj = json.loads(sa)
+                if isinstance(obj, dict):
+                    ad["special_attributes"] = obj
+            except Exception:
+                pass
+
+    rep = md.get("republication_interval")
+    if rep not in (None, ""):
+        ri = safe_int(rep, None)
+        if ri is not None:
+            ad["republication_interval"] = ri
+
+    ad["images"] = ["cropped_*.jpg"]
+    return ad
+
+
+def render_ad(overrides: Dict, profile: Dict, current: Optional[Dict] = None) -> Dict:
+    # `current` is the ad's YAML as it is now; keys this does not render are carried over
+    ad = build_ad(with_defaults(overrides, profile.get("defaults") or {}))
+    suffix = (profile.get("description_suffix") or "").strip()
+    if suffix:
+        ad["description"] = f"{ad['description']}\n\n{suffix}\n" if ad["description"] else f"{suffix}\n"
+    for k, v in (current or {}).items():
+        if k not in RENDERED_KEYS:
+            ad[k] = v
+    return ad
+
+
+def strip_suffix(description: str, profile: Dict) -> str:
+    # For ads written before the profile existed: recover the item's own description
+    suffix = (profile.get("description_suffix") or "").strip()
+    desc = (description or "").rstrip()
+    if suffix and desc.endswith(suffix):
+        desc = desc[: -len(suffix)].rstrip()
+    return desc
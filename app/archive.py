@@ -0,0 +1,200 @@
+import hashlib
+import json
+import os
+import re
+import time
+from pathlib import Path
+from typing import Dict, Optional, Set
+
+from PIL import Image, ImageOps
+
+from app.common import ADS_ARCHIVE_DIR, ADS_DIR, BLOBS_DIR, IMAGE_EXTS, INPUT_ARCHIVE_DIR, KLEIN_LOG_PATH, MANIFESTS_DIR, WORK_DIR, get_cfg
+from app.events import emit
+from app.helpers import _dir_size, _format_bytes
+from app.journal import archived_input_paths
+
+# ----------------------------
+# Content-addressed archive storage
+# ----------------------------
+# Archived item dirs stay plain directories (so undo can move them back),
+# but every file in them is a hardlink to a blob in BLOBS_DIR named by its
+# sha256. Identical photos/crops are stored once. A manifest per item dir
+# (kept in MANIFESTS_DIR, outside the item dir, so undo does not carry it
+# back into the input folder) records the hashes; entries older than
+# `archive_full_days` get their images downscaled to `archive_max_edge` pixels,
+# except input folders whose ad is still pending, which undo may restore.
+
+ARCHIVE_FULL_DAYS = float(get_cfg("archive_full_days", 30))
+ARCHIVE_MAX_EDGE = int(get_cfg("archive_max_edge", 1600))
+
+
+def _sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _blob_path(digest: str) -> Path:
+    return BLOBS_DIR / digest[:2] / digest
+
+
+def _link_to_blob(path: Path, digest: str):
+    # Make `path` a hardlink to the blob for `digest`, adopting the file as blob if new
+    blob = _blob_path(digest)
+    blob.parent.mkdir(parents=True, exist_ok=True)
+    if not blob.exists():
+        try:
+            os.link(path, blob)
+            return
+        except FileExistsError:
+            # Another worker stored the same content in the meantime
+            pass
+    if os.path.samefile(path, blob):
+        return
+    tmp = path.with_name(path.name + ".lnk")
+    tmp.unlink(missing_ok=True)
+    os.link(blob, tmp)
+    os.replace(tmp, path)
+
+
+def _manifest_path(item_dir: Path) -> Path:
+    # e.g. .work/input_archive/foo -> .work/manifests/input_archive/foo.json
+    rel = item_dir.relative_to(WORK_DIR)
+    return MANIFESTS_DIR / rel.parent / f"{rel.name}.json"
+
+
+def _read_manifest(item_dir: Path) -> Optional[Dict]:
+    try:
+        return json.loads(_manifest_path(item_dir).read_text(encoding="utf-8"))
+    except Exception:
+        return None
+
+
+def _write_manifest(item_dir: Path, manifest: Dict):
+    path = _manifest_path(item_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(manifest, indent=1), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _gc_manifests():
+    # Manifests of item dirs that were restored by undo or cleared
+    if not MANIFESTS_DIR.exists():
+        return
+    for m in MANIFESTS_DIR.rglob("*.json"):
+        item_dir = WORK_DIR / m.parent.relative_to(MANIFESTS_DIR) / m.name[: -len(".json")]
+        if not item_dir.is_dir():
+            m.unlink(missing_ok=True)
+
+
+def store_dir(item_dir: Path):
+    # Deduplicate all files of an archived item dir into the blob store
+    if not item_dir.is_dir():
+        return
+    old = _read_manifest(item_dir) or {}
+    old_files = old.get("files", {})
+    files = {}
+    for p in sorted(item_dir.iterdir()):
+        if not p.is_file() or p.suffix in (".tmp", ".lnk"):
+            continue
+        entry = old_files.get(p.name)
+        # Files restored by undo and archived again are still linked to their blob
+        if not (entry and _blob_path(entry["sha256"]).exists() and os.path.samefile(p, _blob_path(entry["sha256"]))):
+            entry = {"sha256": _sha256(p), "reduced": False}
+            _link_to_blob(p, entry["sha256"])
+        files[p.name] = entry
+    _write_manifest(item_dir, {"archived": time.time(), "files": files})
+
+
+def _downscale(item_dir: Path, manifest: Dict, max_edge: int):
+    for name, entry in manifest["files"].items():
+        p = item_dir / name
+        if entry.get("reduced") or p.suffix.lower() not in IMAGE_EXTS or not p.exists():
+            continue
+        tmp = p.with_name(p.name + ".tmp")
+        try:
+            with Image.open(p) as im:
+                if max(im.size) <= max_edge:
+                    entry["reduced"] = True
+                    continue
+                fmt = im.format
+                im = ImageOps.exif_transpose(im)
+                im.thumbnail((max_edge, max_edge))
+                if p.suffix.lower() in (".jpg", ".jpeg"):
+                    im.convert("RGB").save(tmp, format="JPEG", quality=85, optimize=True)
+                else:
+                    im.save(tmp, format=fmt)
+        except Exception:
+            tmp.unlink(missing_ok=True)
+            continue
+        digest = _sha256(tmp)
+        os.replace(tmp, p)
+        _link_to_blob(p, digest)
+        entry.update({"sha256": digest, "reduced": True, "original_sha256": entry["sha256"]})
+    _write_manifest(item_dir, manifest)
+
+
+def gc_blobs() -> int:
+    # A blob whose only remaining link is the store itself is unreferenced
+    freed = 0
+    if not BLOBS_DIR.exists():
+        return freed
+    for blob in BLOBS_DIR.glob("*/*"):
+        try:
+            st = blob.stat()
+            if st.st_nlink <= 1:
+                blob.unlink()
+                freed += st.st_size
+        except Exception:
+            pass
+    for d in BLOBS_DIR.iterdir():
+        try:
+            d.rmdir()
+        except OSError:
+            pass
+    return freed
+
+
+def archive_size() -> int:
+    # Archives plus log; files hardlinked to blobs are counted once
+    log_size = KLEIN_LOG_PATH.stat().st_size if KLEIN_LOG_PATH.exists() else 0
+    seen = set()
+    return _dir_size(ADS_ARCHIVE_DIR, seen) + _dir_size(INPUT_ARCHIVE_DIR, seen) + _dir_size(BLOBS_DIR, seen) + log_size
+
+
+def emit_archive_size():
+    total = archive_size()
+    emit("archive_size", bytes=total, human=_format_bytes(total))
+
+
+def _undo_sources() -> Set[Path]:
+    # Journaled ones, plus pre-journal name / name__N ones of a still pending ad
+    keep = set(archived_input_paths())
+    if INPUT_ARCHIVE_DIR.exists():
+        for d in INPUT_ARCHIVE_DIR.iterdir():
+            if (ADS_DIR / re.sub(r"__\d+$", "", d.name)).is_dir():
+                keep.add(d)
+    return keep
+
+
+def compact_archive(full_days: float = ARCHIVE_FULL_DAYS, max_edge: int = ARCHIVE_MAX_EDGE) -> int:
+    # Store un-manifested items, downscale entries older than full_days, drop unreferenced blobs
+    cutoff = time.time() - full_days * 86400
+    keep_full = _undo_sources()
+    for root in (INPUT_ARCHIVE_DIR, ADS_ARCHIVE_DIR):
+        if not root.exists():
+            continue
+        for item_dir in sorted(p for p in root.iterdir() if p.is_dir()):
+            manifest = _read_manifest(item_dir)
+            if manifest is None:
+                store_dir(item_dir)
+                manifest = _read_manifest(item_dir)
+            if manifest and manifest.get("archived", 0) < cutoff and item_dir not in keep_full:
+                _downscale(item_dir, manifest, max_edge)
+    _gc_manifests()
+    freed = gc_blobs()
+    emit_archive_size()
+    return freed
@@ -39,9 +39,16 @@ ADS_DIR = WORK_DIR / "ads"
 ADS_ARCHIVE_DIR = WORK_DIR / "ads_archive"
 INPUT_ARCHIVE_DIR = WORK_DIR / "input_archive"
 AUDIO_DIR = WORK_DIR / "audio"
+UPLOADS_DIR = WORK_DIR / "uploads"
+TRANSCRIPTS_DIR = WORK_DIR / "transcripts"
 KLEIN_LOG_PATH = WORK_DIR / "kleinanzeigen_bot.log"
+JOURNAL_PATH = WORK_DIR / "journal.sqlite3"
+STATE_PATH = WORK_DIR / "state.sqlite3"
+STAGING_DIR = WORK_DIR / "staging"
+BLOBS_DIR = WORK_DIR / "blobs"
+MANIFESTS_DIR = WORK_DIR / "manifests"
 
-for p in (WORK_DIR, ADS_DIR, ADS_ARCHIVE_DIR, AUDIO_DIR, INPUT_ARCHIVE_DIR):
+for p in (WORK_DIR, ADS_DIR, ADS_ARCHIVE_DIR, AUDIO_DIR, INPUT_ARCHIVE_DIR, STAGING_DIR, BLOBS_DIR, UPLOADS_DIR, TRANSCRIPTS_DIR):
     p.mkdir(parents=True, exist_ok=True)
 
 BROWSER_CMD = [get_cfg("chromium_path"),] + klein_cfg["browser"]["arguments"]
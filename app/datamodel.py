@@ -1,8 +1,8 @@
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional
 
 from dataclasses import dataclass
 from pathlib import Path
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 
 @dataclass
@@ -17,6 +17,44 @@ class UndoPayload(BaseModel):
     dir: str
 
 
+class DraftPayload(BaseModel):
+    # Edited transcript; falls back to the cached one
+    transcript: Optional[str] = None
+
+
+class UploadPayload(BaseModel):
+    name: str
+    size: int
+    # Client-side identity of the file (e.g. name + size + lastModified), used to resume
+    fingerprint: str = ""
+    # Id of the selection this file was uploaded with; files are grouped within a batch only
+    batch: str
+
+
+class BulkEditPayload(BaseModel):
+    # Merged into each matching ad's own values; dicts merge, other values replace
+    patch: Dict = {}
+    # Dotted keys to drop so they inherit from the profile again (e.g. "contact.phone")
+    unset: List[str] = []
+    # Filters (all optional, combined with AND)
+    dirs: Optional[List[str]] = None
+    category: Optional[str] = None
+    title_contains: Optional[str] = None
+
+
+class AdProfileDefaults(BaseModel):
+    # Any ad field may get a default; these two are merged into the ad's own values
+    model_config = ConfigDict(extra="allow")
+    contact: Optional[Dict[str, Any]] = None
+    shipping_options: Optional[List[str]] = None
+
+
+class AdProfile(BaseModel):
+    # Same shape as ad_profile.yaml
+    defaults: AdProfileDefaults = AdProfileDefaults()
+    description_suffix: str = ""
+
+
 class SelectionCrop(BaseModel):
     x: float; y: float; w: float; h: float  # normalized [0,1]
 
@@ -1,5 +1,5 @@
 from pathlib import Path
-from typing import Literal
+from typing import Literal, Optional
 from pydantic import BaseModel
 from pydantic_ai import Agent, RunContext, BinaryContent
 from pydantic_ai.models.google import GoogleModel, GoogleModelSettings
@@ -46,8 +46,8 @@ with open("categories.txt", "r") as f:
 @agent.system_prompt
 def system_prompt(ctx: RunContext[AgentDeps]) -> str:
     return f"""You are a module that creates listings for Kleinanzeigen. 
-You are given an audio recording where a user informally describes a product they want to sell.
-You need to extract the relevant information from the audio and create a structured listing in the schema provided to you.
+You are given an audio recording (or a transcript of one) where a user informally describes a product they want to sell.
+You need to extract the relevant information from the recording and create a structured listing in the schema provided to you.
 
 Make sure that the title is descriptive, includes key details about the product, and is optimized for search (use relevant keywords). It must contain at least 10 characters.
 
@@ -71,35 +71,27 @@ In this example, the last line represents the full category name `Elektronik > A
 
 # --------------------------------------------------------------------------------
 
-async def design_listing(audio_file_path: str) -> any:
+async def design_listing(audio_file_path: Optional[str] = None, transcript: Optional[str] = None) -> any:
 
-    # Read file as bytes
-    audio_bytes = Path(audio_file_path).read_bytes()
+    if transcript is not None:
+        # Text is far cheaper and faster than audio tokens
+        user_prompt = [f"<transcript>\n{transcript}\n</transcript>"]
+    else:
+        # Read file as bytes
+        audio_bytes = Path(audio_file_path).read_bytes()
+        user_prompt = ["", BinaryContent(data=audio_bytes, media_type="audio/webm")]
 
     response: AgentOutput = (await agent.run(
-        user_prompt=["", BinaryContent(data=audio_bytes, media_type="audio/webm")],
+        user_prompt=user_prompt,
         deps=AgentDeps()
     )).output
 
-    # TODO: move this into a description suffix in kleinanzeigen-bot
-    desc = f"""{response.description}
-
-Versand kann gegen Aufpreis erfolgen.
-
-Schau auch gerne bei meinen anderen Anzeigen rein, vielleicht kannst du ja Versand sparen :)
-
-
-
---- Standard Disclaimer:
-
-Privatverkauf. Die Ware wird unter Ausschluss jeglicher Gewährleistung verkauft. Ich schließe jegliche Sachmangelhaftung aus. Die Haftung aufgrund von Arglist und Vorsatz sowie für Schadensersatz wegen Verletzungen von Körper, Leben oder Gesundheit sowie bei grober Fahrlässigkeit oder Vorsatz bleibt unberührt.
-"""
-
     return {
         "type": "OFFER",
         "price_type": response.price_type,
         "title": response.title,
-        "description": desc,
+        # The shared description suffix/disclaimer is added from the ad profile when the ad is written
+        "description": response.description,
         "category": response.category,
         "price": response.price,
         "shipping_type": response.shipping,
@@ -0,0 +1,97 @@
+import asyncio
+import json
+import sqlite3
+import sys
+import time
+from contextlib import closing
+from typing import List, Optional, Set, Tuple
+
+from app.common import STATE_PATH
+
+# ----------------------------
+# Server event bus
+# ----------------------------
+# Code that mutates state calls emit(); events are appended to a table in the
+# shared state DB so that every worker sees them. Each worker runs a single
+# poller that fans new events out to its WebSocket subscribers, so the cost
+# does not grow with the number of open tabs.
+
+POLL_INTERVAL = 0.3
+KEEP_EVENTS = 10000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    payload TEXT NOT NULL
+);
+"""
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(str(STATE_PATH), timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+
+with closing(_connect()) as _conn:
+    _conn.executescript(_SCHEMA)
+
+
+def emit(type_: str, **data):
+    payload = json.dumps({"type": type_, **data})
+    with closing(_connect()) as conn, conn:
+        cur = conn.execute("INSERT INTO events (ts, payload) VALUES (?, ?)", (time.time(), payload))
+        conn.execute("DELETE FROM events WHERE id <= ?", (cur.lastrowid - KEEP_EVENTS,))
+
+
+def _latest_id() -> int:
+    with closing(_connect()) as conn:
+        return conn.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+
+
+def _events_after(last_id: int) -> List[Tuple[int, str]]:
+    with closing(_connect()) as conn:
+        return conn.execute("SELECT id, payload FROM events WHERE id > ? ORDER BY id", (last_id,)).fetchall()
+
+
+_subscribers: Set[asyncio.Queue] = set()
+_poller: Optional[asyncio.Task] = None
+
+
+async def _poll():
+    while True:
+        try:
+            last_id = await asyncio.to_thread(_latest_id)
+            break
+        except Exception as e:
+            print(f"[warn] Event poll failed: {e}", file=sys.stderr)
+            await asyncio.sleep(POLL_INTERVAL)
+    while True:
+        await asyncio.sleep(POLL_INTERVAL)
+        # A failed poll (e.g. "database is locked" while workers write) must not end the task,
+        # or every connected socket would silently stop receiving events
+        try:
+            rows = await asyncio.to_thread(_events_after, last_id)
+        except Exception as e:
+            print(f"[warn] Event poll failed: {e}", file=sys.stderr)
+            continue
+        for last_id, payload in rows:
+            for q in list(_subscribers):
+                try:
+                    q.put_nowait(payload)
+                except asyncio.QueueFull:
+                    pass
+
+
+def subscribe() -> asyncio.Queue:
+    global _poller
+    if _poller is None or _poller.done():
+        _poller = asyncio.create_task(_poll())
+    q: asyncio.Queue = asyncio.Queue(maxsize=1000)
+    _subscribers.add(q)
+    return q
+
+
+def unsubscribe(q: asyncio.Queue):
+    _subscribers.discard(q)
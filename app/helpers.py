@@ -1,18 +1,25 @@
 from pathlib import Path
 import shutil
+from typing import Optional, Set
 import cv2
 import ffmpeg
 import numpy as np
 from PIL import Image
 
 
-def _dir_size(path: Path) -> int:
+def _dir_size(path: Path, seen: Optional[Set] = None) -> int:
+    # Hardlinked files are counted once per `seen` set
+    seen = set() if seen is None else seen
     total = 0
     try:
         for p in path.rglob("*"):
             try:
                 if p.is_file():
-                    total += p.stat().st_size
+                    st = p.stat()
+                    if (st.st_dev, st.st_ino) in seen:
+                        continue
+                    seen.add((st.st_dev, st.st_ino))
+                    total += st.st_size
             except Exception:
                 pass
     except Exception:
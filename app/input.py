@@ -1,53 +1,73 @@
 import os
 from pathlib import Path
 import shutil
+from typing import Optional
 
+from app.archive import emit_archive_size, store_dir
 from app.common import IMAGE_EXTS, INBOX_DIR, INPUT_ARCHIVE_DIR, INPUT_DIR
 from app.datamodel import Item
+from app.events import emit
 from app.helpers import is_black_separator
+from app.items import item_for_rel, item_summary
+from app.journal import Operation, archived_input
+from app.transcribe import move_transcript
+
+
+def ingest_image(file_path: str, target_dir: Optional[str] = None) -> Optional[str]:
+    # A black separator closes the current item, any other image goes into it (opening a new
+    # item if none is open). Returns the item dir that is still open.
+    if is_black_separator(file_path):
+        os.remove(file_path)
+        return None
+    new_item = target_dir is None or not os.path.isdir(target_dir)
+    if new_item:
+        target_dir = str(_free_path(INPUT_DIR / os.path.basename(file_path).split(".")[0]))
+        os.mkdir(target_dir)
+    shutil.move(file_path, target_dir)
+    item = item_summary(item_for_rel(os.path.basename(target_dir)))
+    emit("item_added" if new_item else "item_updated", item=item)
+    return target_dir
 
 
 def process_inbox(inbox_path=INBOX_DIR):
 
     print("Processing inbox...")
-    
-    new_item = True
-    target_dir = None
 
+    target_dir = None
     for filename in sorted(os.listdir(inbox_path)):
         if "." + filename.lower().split(".")[-1] in IMAGE_EXTS:
-            
-            if new_item:
-                target_dir = os.path.join(INPUT_DIR, filename.split(".")[0])
-                os.mkdir(target_dir)
-                new_item = False
+            target_dir = ingest_image(os.path.join(inbox_path, filename), target_dir)
 
-            file_path = os.path.join(inbox_path, filename)
-            if is_black_separator(file_path):
-                os.remove(file_path)
-                new_item = True
-            else:
-                shutil.move(file_path, target_dir)
+
+def _free_path(dest: Path, sep: str = "__") -> Path:
+    # Return dest, or the first free dest + sep + N
+    final = dest
+    n = 1
+    while final.exists():
+        final = dest.parent / f"{dest.name}{sep}{n}"
+        n += 1
+    return final
 
 
-def archive_input_folder(item: Item):
+def archive_input_folder(item: Item, op: Optional[Operation] = None):
     src = item.abs_path
     if not src.exists():
         return
-    dest = INPUT_ARCHIVE_DIR / item.rel_path
-    dest.parent.mkdir(parents=True, exist_ok=True)
+    if op is None:
+        with Operation("archive", item.rel_path) as op:
+            return archive_input_folder(item, op)
     # Move; if exists, add suffix
-    final = dest
-    n = 1
-    while final.exists():
-        final = dest.parent / f"{dest.name}__{n}"
-        n += 1
-    shutil.move(str(src), str(final))
+    final = _free_path(INPUT_ARCHIVE_DIR / item.rel_path)
+    op.move(src, final)
+    op.set_archived_input(item.rel_path, final)
+    op.after_commit(lambda: store_dir(op.resolved(final)))
+    op.after_commit(lambda: move_transcript(item.rel_path, f"archive:{op.resolved(final)}"))
+    op.after_commit(lambda: emit("item_removed", id=item.id))
+    op.after_commit(emit_archive_size)
 
 
-def restore_input_for_rel(rel_dir: str) -> bool:
-    # Try exact match, then suffixed variants like name__N
-    rel = Path(rel_dir)
+def _legacy_archived_input(rel: Path) -> Optional[Path]:
+    # Archives created before the journal existed: exact match or name__N, most recent wins
     exact = INPUT_ARCHIVE_DIR / rel
     candidates = []
     if exact.exists():
@@ -59,19 +79,25 @@ def restore_input_for_rel(rel_dir: str) -> bool:
             if p.is_dir():
                 candidates.append(p)
     if not candidates:
-        return False
-    # pick most recent
+        return None
     candidates.sort(key=lambda p: p.stat().st_mtime, reverse=True)
-    src = candidates[0]
-    dst = INPUT_DIR / rel
-    final = dst
-    n = 1
-    while final.exists():
-        final = dst.parent / f"{dst.name}__undo{n}"
-        n += 1
-    final.parent.mkdir(parents=True, exist_ok=True)
-    try:
-        shutil.move(str(src), str(final))
-        return True
-    except Exception:
+    return candidates[0]
+
+
+def restore_input_for_rel(rel_dir: str, op: Optional[Operation] = None) -> bool:
+    if op is None:
+        with Operation("undo", rel_dir) as op:
+            return restore_input_for_rel(rel_dir, op)
+    rel = Path(rel_dir)
+    src = archived_input(rel.as_posix())
+    if src is None or not src.exists():
+        src = _legacy_archived_input(rel)
+    if src is None:
         return False
+    final = _free_path(INPUT_DIR / rel, sep="__undo")
+    op.move(src, final)
+    op.set_archived_input(rel.as_posix(), None)
+    op.after_commit(lambda: move_transcript(f"archive:{src}", op.resolved(final).relative_to(INPUT_DIR).as_posix()))
+    op.after_commit(lambda: emit("item_added", item=item_summary(item_for_rel(op.resolved(final).relative_to(INPUT_DIR).as_posix()))))
+    op.after_commit(emit_archive_size)
+    return True
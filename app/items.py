@@ -1,10 +1,11 @@
-from typing import List
+from typing import Dict, List
 
 import re
 from fastapi import HTTPException
 
 from app.datamodel import Item
 from app.common import INPUT_DIR, IMAGE_EXTS
+from app.state import item_ids
 
 
 _slug_rx = re.compile(r"[^a-z0-9]+")
@@ -18,11 +19,10 @@ def list_items() -> List[Item]:
         INPUT_DIR.mkdir(parents=True, exist_ok=True)
     subdirs = [p for p in INPUT_DIR.iterdir() if p.is_dir()]
     subdirs.sort(key=lambda p: p.name.lower())
-    items: List[Item] = []
-    for idx, p in enumerate(subdirs):
-        rel = str(p.relative_to(INPUT_DIR)).replace("\\", "/")
-        items.append(Item(id=idx, name=p.name, rel_path=rel, abs_path=p))
-    return items
+    rels = [str(p.relative_to(INPUT_DIR)).replace("\\", "/") for p in subdirs]
+    # Ids are stable per folder, so they stay valid across workers and after other items are archived
+    ids = item_ids(rels)
+    return [Item(id=ids[rel], name=p.name, rel_path=rel, abs_path=p) for p, rel in zip(subdirs, rels)]
 
 def list_images(item: Item) -> List[str]:
     files = []
@@ -34,10 +34,28 @@ def list_images(item: Item) -> List[str]:
     return files
 
 
+def item_for_rel(rel: str) -> Item:
+    p = INPUT_DIR / rel
+    return Item(id=item_ids([rel])[rel], name=p.name, rel_path=rel, abs_path=p)
+
+
+def item_summary(item: Item) -> Dict:
+    return {"id": item.id, "name": item.name, "imageCount": len(list_images(item))}
+
+
 ITEMS: List[Item] = list_items()
 
 
+def refresh_items() -> List[Item]:
+    global ITEMS
+    ITEMS = list_items()
+    return ITEMS
+
+
 def item_by_id(item_id: int) -> Item:
-    if 0 <= item_id < len(ITEMS):
-        return ITEMS[item_id]
+    # Another worker may have archived or restored items since our last listing
+    for refresh in (False, True):
+        for it in (refresh_items() if refresh else ITEMS):
+            if it.id == item_id and it.abs_path.exists():
+                return it
     raise HTTPException(status_code=404, detail="Item not found")
\ No newline at end of file
@@ -0,0 +1,247 @@
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import time
+import uuid
+from contextlib import closing
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.common import JOURNAL_PATH, STAGING_DIR
+
+# ----------------------------
+# Write-ahead journal for file operations
+# ----------------------------
+# Every submit/archive/undo/publish is recorded as one operation: a list of
+# directory moves (all inside WORK_DIR, so each one is a single os.replace)
+# plus updates to the archive index. The operation is written to the journal
+# before the first move happens; recover() rolls unfinished operations forward
+# on startup, so a crash never leaves a half-moved state behind. A move that
+# fails (e.g. permissions) marks its operation as failed and keeps the staging
+# dir and the journaled moves for manual repair, instead of failing every start.
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ops (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    rel TEXT NOT NULL,
+    state TEXT NOT NULL,
+    staging TEXT NOT NULL,
+    index_updates TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS moves (
+    op_id INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    src TEXT NOT NULL,
+    dst TEXT NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (op_id, seq)
+);
+CREATE TABLE IF NOT EXISTS archived_inputs (
+    rel TEXT PRIMARY KEY,
+    path TEXT NOT NULL
+);
+"""
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(str(JOURNAL_PATH), timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=FULL")
+    return conn
+
+
+with closing(_connect()) as _conn:
+    _conn.executescript(_SCHEMA)
+
+
+def _apply_move(src: Path, dst: Path):
+    # Idempotent so that replaying a journal entry is always safe
+    if src.exists():
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(src, dst)
+    elif not dst.exists():
+        print(f"[warn] Journal move lost, neither {src} nor {dst} exist", file=sys.stderr)
+
+
+def _free_dst(dst: Path) -> Path:
+    final = dst
+    n = 1
+    while final.exists():
+        final = dst.parent / f"{dst.name}__{n}"
+        n += 1
+    return final
+
+
+def _apply_index_updates(conn: sqlite3.Connection, updates: Dict[str, Optional[str]]):
+    for rel, path in updates.items():
+        if path is None:
+            conn.execute("DELETE FROM archived_inputs WHERE rel = ?", (rel,))
+        else:
+            conn.execute("INSERT OR REPLACE INTO archived_inputs (rel, path) VALUES (?, ?)", (rel, path))
+
+
+def _finish(conn: sqlite3.Connection, op_id: int, staging: Path, updates: Dict[str, Optional[str]]):
+    with conn:
+        _apply_index_updates(conn, updates)
+        conn.execute("DELETE FROM moves WHERE op_id = ?", (op_id,))
+        conn.execute("DELETE FROM ops WHERE id = ?", (op_id,))
+    shutil.rmtree(staging, ignore_errors=True)
+
+
+def _fail(conn: sqlite3.Connection, op_id: int, kind: str, rel: str, staging: Path, e: OSError):
+    print(f"[error] {kind} of '{rel}' failed halfway ({e}); moves are kept in the journal "
+          f"(op {op_id}) and staged data in {staging} for manual repair", file=sys.stderr)
+    with conn:
+        conn.execute("UPDATE ops SET state = 'failed' WHERE id = ?", (op_id,))
+
+
+def _apply_moves(conn: sqlite3.Connection, op_id: int, moves: List[Tuple[int, Path, Path]]):
+    for seq, src, dst in moves:
+        _apply_move(src, dst)
+        with conn:
+            conn.execute("UPDATE moves SET done = 1 WHERE op_id = ? AND seq = ?", (op_id, seq))
+
+
+class Operation:
+    """
+    A journaled file operation. Use as a context manager: planned moves are
+    committed on a clean exit and the staging area is discarded on error.
+    """
+
+    def __init__(self, kind: str, rel: str = ""):
+        self.kind = kind
+        self.rel = rel
+        self.staging = STAGING_DIR / uuid.uuid4().hex
+        self.moves: List[Tuple[Path, Path]] = []
+        self.index_updates: Dict[str, Optional[str]] = {}
+        self._trash_n = 0
+        self._after_commit: List[Callable[[], None]] = []
+        self._resolved: Dict[Path, Path] = {}
+
+    def __enter__(self) -> "Operation":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+        return False
+
+    def stage_dir(self, name: str = "data") -> Path:
+        # Scratch directory for new content, published later via move()
+        d = self.staging / name
+        d.mkdir(parents=True, exist_ok=True)
+        return d
+
+    def move(self, src: Path, dst: Path):
+        self.moves.append((Path(src), Path(dst)))
+
+    def trash(self, path: Path):
+        # Deleting is a move into the staging area, which is removed on commit
+        self._trash_n += 1
+        self.move(path, self.staging / "trash" / str(self._trash_n))
+
+    def set_archived_input(self, rel: str, path: Optional[Path]):
+        self.index_updates[rel] = None if path is None else str(path)
+
+    def after_commit(self, fn: Callable[[], None]):
+        # Best-effort follow-up work; not journaled, so it must be safe to skip or redo
+        self._after_commit.append(fn)
+
+    def resolved(self, dst: Path) -> Path:
+        # Where a planned destination actually ended up (see _resolve_collisions)
+        return self._resolved.get(Path(dst), Path(dst))
+
+    def _resolve_collisions(self):
+        # Destinations are picked at plan time; another worker may have taken one since.
+        # A destination vacated by an earlier move of this operation is still free.
+        vacated = set()
+        for i, (src, dst) in enumerate(self.moves):
+            if dst.exists() and dst not in vacated and self.staging not in dst.parents:
+                free = _free_dst(dst)
+                self._resolved[dst] = free
+                self.moves[i] = (src, free)
+                for rel, path in self.index_updates.items():
+                    if path == str(dst):
+                        self.index_updates[rel] = str(free)
+            vacated.add(src)
+
+    def commit(self):
+        if not self.moves and not self.index_updates:
+            self.abort()
+            return
+        self._resolve_collisions()
+        with closing(_connect()) as conn:
+            with conn:
+                cur = conn.execute(
+                    "INSERT INTO ops (kind, rel, state, staging, index_updates, created) VALUES (?, ?, 'committing', ?, ?, ?)",
+                    (self.kind, self.rel, str(self.staging), json.dumps(self.index_updates), time.time()),
+                )
+                op_id = cur.lastrowid
+                conn.executemany(
+                    "INSERT INTO moves (op_id, seq, src, dst) VALUES (?, ?, ?, ?)",
+                    [(op_id, i, str(s), str(d)) for i, (s, d) in enumerate(self.moves)],
+                )
+            try:
+                _apply_moves(conn, op_id, [(i, s, d) for i, (s, d) in enumerate(self.moves)])
+            except OSError as e:
+                _fail(conn, op_id, self.kind, self.rel, self.staging, e)
+                raise
+            _finish(conn, op_id, self.staging, self.index_updates)
+        for fn in self._after_commit:
+            try:
+                fn()
+            except Exception as e:
+                print(f"[warn] Post-commit step of {self.kind} failed: {e}", file=sys.stderr)
+
+    def abort(self):
+        shutil.rmtree(self.staging, ignore_errors=True)
+
+
+def recover():
+    # Roll forward every operation that was journaled but not finished
+    with closing(_connect()) as conn:
+        with conn:
+            # Finished operations used to be kept as 'done'
+            conn.execute("DELETE FROM ops WHERE state = 'done'")
+        pending = conn.execute(
+            "SELECT id, kind, rel, staging, index_updates FROM ops WHERE state = 'committing' ORDER BY id"
+        ).fetchall()
+        for op_id, kind, rel, staging, updates in pending:
+            print(f"Recovering interrupted {kind} of '{rel}'...")
+            moves = conn.execute(
+                "SELECT seq, src, dst FROM moves WHERE op_id = ? AND done = 0 ORDER BY seq", (op_id,)
+            ).fetchall()
+            try:
+                _apply_moves(conn, op_id, [(seq, Path(src), Path(dst)) for seq, src, dst in moves])
+            except OSError as e:
+                _fail(conn, op_id, kind, rel, Path(staging), e)
+                continue
+            _finish(conn, op_id, Path(staging), json.loads(updates))
+        kept = {Path(r[0]) for r in conn.execute("SELECT staging FROM ops WHERE state = 'failed'")}
+
+    # Anything else left in staging belongs to operations that never got journaled
+    for child in STAGING_DIR.iterdir():
+        if child not in kept:
+            shutil.rmtree(child, ignore_errors=True)
+
+
+def archived_input(rel: str) -> Optional[Path]:
+    with closing(_connect()) as conn:
+        row = conn.execute("SELECT path FROM archived_inputs WHERE rel = ?", (rel,)).fetchone()
+    return Path(row[0]) if row else None
+
+
+def archived_input_paths() -> List[Path]:
+    with closing(_connect()) as conn:
+        return [Path(r[0]) for r in conn.execute("SELECT path FROM archived_inputs")]
+
+
+def clear_archived_inputs():
+    with closing(_connect()) as conn, conn:
+        conn.execute("DELETE FROM archived_inputs")
@@ -1,152 +1,269 @@
 import json
+import os
 from pathlib import Path
-import shutil
 from typing import Dict, List, Optional
 
 import subprocess
 import sys
+import threading
 import time
 
 import yaml
 
-from app.common import ADS_ARCHIVE_DIR, ADS_DIR, BROWSER_CMD, INPUT_ARCHIVE_DIR, KLEIN_BIN, KLEIN_CONFIG_PATH, KLEIN_LOG_PATH
+from app.ad_template import RENDERED_KEYS, apply_patch, load_profile, profile_digest, render_ad, save_profile, strip_suffix
+from app.archive import emit_archive_size, store_dir
+from app.common import ADS_ARCHIVE_DIR, ADS_DIR, BROWSER_CMD, KLEIN_BIN, KLEIN_CONFIG_PATH, KLEIN_LOG_PATH
 from app.datamodel import Item
-from app.helpers import safe_int
+from app.events import emit
+from app.journal import Operation
+from app.pending_index import IndexRow, delete_rows, load_rows, upsert_rows
 from app.items import slugify
+from app.state import get_value, locked, set_value
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
 
-_browser_proc: Optional[subprocess.Popen] = None
 
 def start_debug_browser_once():
-    global _browser_proc
-    if _browser_proc and _browser_proc.poll() is None:
-        return
-    try:
-        _browser_proc = subprocess.Popen(BROWSER_CMD, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        # give it a moment to bind the port
-        time.sleep(1.5)
-    except Exception as e:
-        print(f"[warn] Could not start debug browser: {e}", file=sys.stderr)
+    # One debug browser (one profile, one port) for all server workers; its PID is shared state
+    with locked("debug_browser", ttl=30):
+        pid = get_value("debug_browser_pid")
+        if pid and _pid_alive(int(pid)):
+            return
+        try:
+            proc = subprocess.Popen(BROWSER_CMD, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            # Reap it when it exits, so a closed browser does not linger as a "live" zombie PID
+            threading.Thread(target=proc.wait, daemon=True).start()
+            set_value("debug_browser_pid", str(proc.pid))
+            # give it a moment to bind the port
+            time.sleep(1.5)
+        except Exception as e:
+            print(f"[warn] Could not start debug browser: {e}", file=sys.stderr)
+
+
+def _pump_lines(stream, buf: List[str], name: str):
+    for line in stream:
+        buf.append(line)
+        emit("publish_log", stream=name, line=line.rstrip("\n"))
 
 
 def run_bulk_publish() -> subprocess.CompletedProcess:
     start_debug_browser_once()
     cmd = [str(KLEIN_BIN), "publish", "--ads=new", f"--config={str(KLEIN_CONFIG_PATH)}", f"--logfile={str(KLEIN_LOG_PATH)}"]
-    return subprocess.run(cmd, capture_output=True, text=True, check=False)
+    # Stream output line by line so the UI can follow the run
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1)
+    out: List[str] = []
+    err: List[str] = []
+    t = threading.Thread(target=_pump_lines, args=(proc.stderr, err, "stderr"), daemon=True)
+    t.start()
+    _pump_lines(proc.stdout, out, "stdout")
+    t.join()
+    proc.wait()
+    return subprocess.CompletedProcess(cmd, proc.returncode, "".join(out), "".join(err))
 
 
 def find_ad_files(root: Path) -> List[Path]:
     return list(root.rglob("ad_*.y*ml"))  # yaml/yml
 
 
-def write_ad_yaml(item: Item, md: Dict, ad_dir: Path) -> Path:
-    ad_dir.mkdir(parents=True, exist_ok=True)
+OVERRIDES_NAME = "overrides.json"
+# Rendered keys that come from the item's own values
+OVERRIDE_KEYS = RENDERED_KEYS - {"active", "images"}
+
+# The C implementations are several times faster when (re-)rendering many ads
+_Dumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+_Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+def _write_overrides(ad_dir: Path, overrides: Dict):
+    tmp = ad_dir / (OVERRIDES_NAME + ".tmp")
+    tmp.write_text(json.dumps(overrides, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, ad_dir / OVERRIDES_NAME)
 
-    ad = {}
-    ad["active"] = True
-    ad["type"] = (md.get("type") or "OFFER").strip().upper()
-    ad["title"] = (md.get("title") or "").strip()
-    ad["description"] = (md.get("description") or "").strip()
-    ad["category"] = (md.get("category") or "").strip()
-
-    price = safe_int(md.get("price"), None)
-    if price is not None:
-        ad["price"] = price
-    ad["price_type"] = (md.get("price_type") or "NEGOTIABLE").strip().upper()
-
-    ship_type = (md.get("shipping_type") or "SHIPPING").strip().upper()
-    ad["shipping_type"] = ship_type
-    if md.get("shipping_costs") not in (None, ""):
-        ad["shipping_costs"] = float(md["shipping_costs"])
-    shipping_options = md.get("shipping_options") or []
-    if isinstance(shipping_options, str):
-        shipping_options = [s.strip() for s in shipping_options.split(",") if s.strip()]
-    ad["shipping_options"] = shipping_options
-    sd = md.get("sell_directly")
-    if sd is not None:
-        ad["sell_directly"] = bool(sd)
-
-    contact = md.get("contact") or {}
-    ad["contact"] = {
-        "name": contact.get("name", ""),
-        "street": contact.get("street", ""),
-        "zipcode": str(contact.get("zipcode", "")) if contact.get("zipcode") is not None else "",
-        "phone": str(contact.get("phone", "")) if contact.get("phone") is not None else "",
-    }
 
-    sa = md.get("special_attributes")
-    if isinstance(sa, dict):
-        ad["special_attributes"] = sa
-    else:
-        # try to parse JSON string
-        if isinstance(sa, str) and sa.strip():
-            try:
-                obj = json.loads(sa)
-                if isinstance(obj, dict):
-                    ad["special_attributes"] = obj
-            except Exception:
-                pass
-
-    rep = md.get("republication_interval")
-    if rep not in (None, ""):
-        ri = safe_int(rep, None)
-        if ri is not None:
-            ad["republication_interval"] = ri
-
-    ad["images"] = ["cropped_*.jpg"]
-
-    fname = f"ad_{slugify(item.name)}.yaml"
+def _write_ad_files(ad_dir: Path, fname: str, overrides: Optional[Dict], ad: Dict) -> Path:
+    # overrides=None keeps the existing overrides.json (e.g. when only the profile changed)
+    ad_dir.mkdir(parents=True, exist_ok=True)
+    if overrides is not None:
+        _write_overrides(ad_dir, overrides)
     ad_file = ad_dir / fname
-    with open(ad_file, "w", encoding="utf-8") as f:
-        yaml.safe_dump(ad, f, sort_keys=False, allow_unicode=True)
+    tmp = ad_dir / (fname + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        yaml.dump(ad, f, Dumper=_Dumper, sort_keys=False, allow_unicode=True)
+    os.replace(tmp, ad_file)
     return ad_file
 
 
-def list_pending_ads() -> List[Dict]:
-    ads = []
+def write_ad_yaml(item: Item, md: Dict, ad_dir: Path) -> Path:
+    # The item's own values are kept next to the YAML so the ad can be re-rendered from the profile later
+    return _write_ad_files(ad_dir, f"ad_{slugify(item.name)}.yaml", md, render_ad(md, load_profile()))
+
+
+def _parse_ad(ad: Path, profile: Dict) -> IndexRow:
+    try:
+        data = yaml.load(ad.read_text(encoding="utf-8"), Loader=_Loader) or {}
+    except Exception:
+        data = {}
+    try:
+        overrides = json.loads((ad.parent / OVERRIDES_NAME).read_text(encoding="utf-8"))
+    except Exception:
+        # Written before the profile existed: the YAML itself holds the item's values
+        overrides = {k: v for k, v in data.items() if k in OVERRIDE_KEYS}
+        overrides["description"] = strip_suffix(data.get("description", ""), profile)
+    rel_dir = ad.parent.relative_to(ADS_DIR).as_posix()
+    return (rel_dir, ad.name, ad.stat().st_mtime_ns, overrides, data)
+
+
+def _merge_outside_edits(old: IndexRow, new: IndexRow, profile: Dict) -> IndexRow:
+    # The YAML changed since it was indexed, so it was edited outside the app: rendered
+    # values that differ from the indexed ones become the ad's own values, or a re-render
+    # would undo the edit. Keys the app does not render are kept by render_ad anyway.
+    rel_dir, fname, mtime_ns, overrides, data = new
+    merged = dict(overrides)
+    for k in OVERRIDE_KEYS:
+        if data.get(k) == old[4].get(k):
+            continue
+        if k not in data:
+            merged.pop(k, None)
+        elif k == "description":
+            merged[k] = strip_suffix(data[k], profile)
+        elif isinstance(data[k], dict) and isinstance(old[4].get(k), dict):
+            # Only the edited fields, e.g. a hand-changed phone must not pin the profile's name
+            merged[k] = {**(merged.get(k) or {}), **{sk: sv for sk, sv in data[k].items() if old[4][k].get(sk) != sv}}
+        else:
+            merged[k] = data[k]
+    if merged != overrides:
+        _write_overrides(ADS_DIR / rel_dir, merged)
+    return (rel_dir, fname, mtime_ns, merged, data)
+
+
+def indexed_pending_ads() -> List[IndexRow]:
+    # Only ads whose YAML changed since they were indexed get parsed again
+    rows = load_rows()
+    result: List[IndexRow] = []
+    fresh: List[IndexRow] = []
+    profile = None
     for ad in find_ad_files(ADS_DIR):
-        try:
-            data = yaml.safe_load(ad.read_text(encoding="utf-8")) or {}
-        except Exception:
-            data = {}
         rel_dir = ad.parent.relative_to(ADS_DIR).as_posix()
-        ads.append({
-            "dir": rel_dir,
-            "file": ad.name,
-            "title": data.get("title", ""),
-            "category": data.get("category", ""),
-            "price": data.get("price", None),
-        })
-    ads.sort(key=lambda x: x["dir"])
-    return ads
-
-
-def remove_pending_ad_dir(rel_dir: str):
-    d = ADS_DIR / rel_dir
-    if d.exists():
-        shutil.rmtree(d, ignore_errors=True)
+        row = rows.pop(rel_dir, None)
+        try:
+            mtime_ns = ad.stat().st_mtime_ns
+        except FileNotFoundError:
+            continue
+        if row is None or row[1] != ad.name or row[2] != mtime_ns:
+            if profile is None:
+                profile = load_profile()
+            old, row = row, _parse_ad(ad, profile)
+            if old is not None and old[1] == ad.name and (ad.parent / OVERRIDES_NAME).exists():
+                row = _merge_outside_edits(old, row, profile)
+            fresh.append(row)
+        result.append(row)
+    if fresh:
+        upsert_rows(fresh)
+    if rows:
+        delete_rows(list(rows))
+    result.sort(key=lambda r: r[0])
+    return result
 
 
-def archive_published_ads():
-    # Move all remaining ad dirs from PUB_ADS_DIR to PUB_ARCHIVE_DIR
-    # We move *directories* that contain ad_*.yml files.
-    for ad in find_ad_files(ADS_DIR):
-        d = ad.parent
-        rel = d.relative_to(ADS_DIR)
-        dst = ADS_ARCHIVE_DIR / rel
-        dst.parent.mkdir(parents=True, exist_ok=True)
-        if dst.exists():
-            # merge move: move files individually
-            for p in d.iterdir():
-                target = dst / p.name
-                if target.exists():
-                    target = dst / f"{p.stem}__{int(time.time())}{p.suffix}"
-                shutil.move(str(p), str(target))
-            # cleanup dir
-            try:
-                d.rmdir()
-            except Exception:
-                pass
-        else:
-            shutil.move(str(d), str(dst))
+def _entry(row: IndexRow) -> Dict:
+    rel_dir, fname, _, _, data = row
+    return {
+        "dir": rel_dir,
+        "file": fname,
+        "title": data.get("title", ""),
+        "category": data.get("category", ""),
+        "price": data.get("price", None),
+    }
+
+
+def pending_entry(ad: Path) -> Dict:
+    return _entry(_parse_ad(ad, load_profile()))
+
+
+def list_pending_ads() -> List[Dict]:
+    sync_profile()
+    return [_entry(r) for r in indexed_pending_ads()]
+
 
+def _patch_rows(profile: Dict, patch: Dict, unset: List[str], dirs: Optional[List[str]] = None,
+                category: Optional[str] = None, title_contains: Optional[str] = None) -> List[Dict]:
+    # Filters run on the index, so only the matching ads are rendered and written
+    changed: List[IndexRow] = []
+    for rel_dir, fname, _, overrides, data in indexed_pending_ads():
+        if dirs is not None and rel_dir not in dirs:
+            continue
+        if category and not str(data.get("category", "")).startswith(category):
+            continue
+        if title_contains and title_contains.lower() not in str(data.get("title", "")).lower():
+            continue
+        new_overrides = apply_patch(overrides, patch, unset)
+        new_ad = render_ad(new_overrides, profile, data)
+        if new_overrides == overrides and new_ad == data:
+            continue
+        ad_file = _write_ad_files(ADS_DIR / rel_dir, fname, None if new_overrides == overrides else new_overrides, new_ad)
+        changed.append((rel_dir, fname, ad_file.stat().st_mtime_ns, new_overrides, new_ad))
+    upsert_rows(changed)
+    entries = [_entry(r) for r in changed]
+    if entries:
+        emit("pending_updated", ads=entries)
+    return entries
 
+
+def sync_profile() -> List[Dict]:
+    # Re-render all pending ads if the profile changed since they were rendered (also when edited by hand)
+    digest = profile_digest()
+    if get_value("ad_profile") == digest:
+        return []
+    entries = _patch_rows(load_profile(), {}, [])
+    set_value("ad_profile", digest)
+    return entries
+
+
+def bulk_patch_pending(patch: Dict, unset: List[str], dirs: Optional[List[str]] = None,
+                       category: Optional[str] = None, title_contains: Optional[str] = None) -> List[Dict]:
+    # Apply one patch to the overrides of all matching pending ads and re-render them in a single pass
+    sync_profile()
+    return _patch_rows(load_profile(), patch, unset, dirs, category, title_contains)
+
+
+def update_profile(profile: Dict) -> List[Dict]:
+    # New defaults/suffix apply to every pending ad
+    save_profile(profile)
+    return sync_profile()
+
+
+def remove_pending_ad_dir(rel_dir: str, op: Optional[Operation] = None):
+    d = ADS_DIR / rel_dir
+    if not d.exists():
+        return
+    if op is None:
+        with Operation("remove", rel_dir) as op:
+            return remove_pending_ad_dir(rel_dir, op)
+    op.trash(d)
+    op.after_commit(lambda: emit("pending_removed", dir=rel_dir))
+
+
+def archive_published_ads():
+    # Move all ad dirs from ADS_DIR to ADS_ARCHIVE_DIR in a single journaled operation.
+    # We move *directories* that contain ad_*.yml files; an existing archive dir gets a __N sibling.
+    with Operation("publish") as op:
+        for d in sorted({ad.parent for ad in find_ad_files(ADS_DIR)}):
+            rel = d.relative_to(ADS_DIR)
+            dst = ADS_ARCHIVE_DIR / rel
+            n = 1
+            while dst.exists():
+                dst = ADS_ARCHIVE_DIR / rel.parent / f"{rel.name}__{n}"
+                n += 1
+            op.move(d, dst)
+            # Published ads cannot be undone, so their input may be compacted
+            op.set_archived_input(rel.as_posix(), None)
+            op.after_commit(lambda dst=dst: store_dir(op.resolved(dst)))
+            op.after_commit(lambda rel=rel: emit("pending_removed", dir=rel.as_posix()))
+        op.after_commit(emit_archive_size)
@@ -3,14 +3,20 @@ import time
 import webbrowser
 import uvicorn
 
-from app.common import HOST, PORT
+from app.archive import compact_archive
+from app.common import HOST, PORT, get_cfg
 from app.server import server
 from app.input import process_inbox
+from app.journal import recover
+from app.kleinanzeigen import sync_profile
 
 
 if __name__ == "__main__":
     
+    recover()
+    compact_archive()
     process_inbox()
+    sync_profile()
 
     url = f"http://{HOST}:{PORT}/"
 
@@ -21,4 +27,9 @@ if __name__ == "__main__":
         webbrowser.open(url)
     threading.Thread(target=open_browser, daemon=True).start()
 
-    uvicorn.run(server, host=HOST, port=PORT, log_level="info")
+    # Crop work is CPU-bound; shared state lives in SQLite, so several workers can serve in parallel
+    workers = int(get_cfg("workers", 1))
+    if workers > 1:
+        uvicorn.run("app.server:server", host=HOST, port=PORT, log_level="info", workers=workers)
+    else:
+        uvicorn.run(server, host=HOST, port=PORT, log_level="info")
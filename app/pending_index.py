@@ -0,0 +1,55 @@
+import json
+import sqlite3
+from contextlib import closing
+from typing import Dict, Iterable, List, Tuple
+
+from app.common import STATE_PATH
+
+# ----------------------------
+# Index of parsed pending ads
+# ----------------------------
+# Caches each pending ad's overrides and rendered dict, keyed by its dir and
+# validated by the YAML's mtime, so listing and bulk edits do not re-parse
+# every YAML file. Rows are refreshed lazily whenever a file changed on disk.
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pending_ads (
+    dir TEXT PRIMARY KEY,
+    file TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    overrides TEXT NOT NULL,
+    ad TEXT NOT NULL
+);
+"""
+
+# (dir, file, mtime_ns, overrides, ad)
+IndexRow = Tuple[str, str, int, Dict, Dict]
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(str(STATE_PATH), timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+
+with closing(_connect()) as _conn:
+    _conn.executescript(_SCHEMA)
+
+
+def load_rows() -> Dict[str, IndexRow]:
+    with closing(_connect()) as conn:
+        rows = conn.execute("SELECT dir, file, mtime_ns, overrides, ad FROM pending_ads").fetchall()
+    return {r[0]: (r[0], r[1], r[2], json.loads(r[3]), json.loads(r[4])) for r in rows}
+
+
+def upsert_rows(rows: Iterable[IndexRow]):
+    with closing(_connect()) as conn, conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO pending_ads (dir, file, mtime_ns, overrides, ad) VALUES (?, ?, ?, ?, ?)",
+            [(d, f, m, json.dumps(o), json.dumps(a)) for d, f, m, o, a in rows],
+        )
+
+
+def delete_rows(dirs: List[str]):
+    with closing(_connect()) as conn, conn:
+        conn.executemany("DELETE FROM pending_ads WHERE dir = ?", [(d,) for d in dirs])
@@ -1,28 +1,42 @@
-from typing import List
+from typing import List, Optional
 
+import asyncio
 import os
+import shutil
+import sys
 import time
 
 from pathlib import Path
 from PIL import Image, ImageOps
 
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import Depends, FastAPI, File, Header, HTTPException, Request, UploadFile, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import HTMLResponse
 from fastapi.staticfiles import StaticFiles
 
-from app.common import ADS_ARCHIVE_DIR, ADS_DIR, INPUT_ARCHIVE_DIR, INPUT_DIR, AUDIO_DIR, KLEIN_LOG_PATH, KLEIN_LOG_PATH, ROOT_DIR, get_cfg
-from app.datamodel import SubmitPayload, UndoPayload
-from app.helpers import _clear_dir_contents, _dir_size, _format_bytes, strip_silence_ffmpegpy
+from app.archive import archive_size, compact_archive, emit_archive_size
+from app.common import ADS_ARCHIVE_DIR, ADS_DIR, BLOBS_DIR, INPUT_ARCHIVE_DIR, INPUT_DIR, MANIFESTS_DIR, AUDIO_DIR, KLEIN_LOG_PATH, ROOT_DIR, get_cfg
+from app.datamodel import AdProfile, BulkEditPayload, DraftPayload, Item, SubmitPayload, UndoPayload, UploadPayload
+from app.helpers import _clear_dir_contents, _format_bytes, strip_silence_ffmpegpy
 from app.input import archive_input_folder, restore_input_for_rel
-from app.items import ITEMS, item_by_id, list_images, list_items
-from app.kleinanzeigen import archive_published_ads, list_pending_ads, remove_pending_ad_dir, run_bulk_publish, write_ad_yaml
+from app.journal import Operation, clear_archived_inputs
+from app.events import emit, subscribe, unsubscribe
+from app.items import item_by_id, item_summary, list_images, refresh_items
+from app.state import LEASE_SECONDS, claim_item, claimed_items, locked, release_item
+from app.ad_template import load_profile
+from app.kleinanzeigen import archive_published_ads, bulk_patch_pending, list_pending_ads, pending_entry, remove_pending_ad_dir, run_bulk_publish, update_profile, write_ad_yaml
 from app.design_listing import design_listing
+from app.transcribe import load_transcript, save_transcript, transcribe
+from app.uploads import create_upload, finish_upload, get_upload, write_chunk
 
 
 # Initialize FastAPI server and mount static files for media
 server = FastAPI(title="Kleinanzeigen Assistent")
 server.mount("/media", StaticFiles(directory=str(INPUT_DIR)), name="media")
 
+# A publish run drives a browser and can take a while
+PUBLISH_LEASE_SECONDS = 3600
+
 
 # Serve the main HTML page
 @server.get("/", response_class=HTMLResponse)
@@ -33,24 +47,77 @@ def index():
     return HTMLResponse(index_path.read_text(encoding="utf-8"))
 
 
+# Identify the browser session (tab) making a request
+def session_id(x_session: Optional[str] = Header(None)) -> str:
+    return x_session or "default"
+
+
+# Lease an item for this session or fail if another session is working on it
+def claim_or_409(it: Item, session: str):
+    if not claim_item(it.rel_path, session):
+        raise HTTPException(status_code=409, detail="Item is in use by another session")
+
+
+# Push state changes (items, pending ads, crop progress, publish log, archive size) to the UI
+@server.websocket("/ws")
+async def ws_events(ws: WebSocket):
+    await ws.accept()
+    q = subscribe()
+    # Reading from the socket notices a closed tab right away, not only on the next send
+    closed = asyncio.create_task(_wait_closed(ws))
+    try:
+        while True:
+            get = asyncio.create_task(q.get())
+            done, _ = await asyncio.wait({get, closed}, return_when=asyncio.FIRST_COMPLETED)
+            if closed in done:
+                get.cancel()
+                break
+            await ws.send_text(get.result())
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        closed.cancel()
+        unsubscribe(q)
+
+
+async def _wait_closed(ws: WebSocket):
+    try:
+        while True:
+            await ws.receive_text()
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+
+
 # Return a list of items with their image counts
 @server.get("/api/items")
-def api_items():
-    global ITEMS
-    ITEMS = list_items()
+def api_items(session: str = Depends(session_id)):
+    claimed = claimed_items(session)
     data = []
-    for it in ITEMS:
-        imgs = list_images(it)
-        data.append({"id": it.id, "name": it.name, "imageCount": len(imgs)})
+    for it in refresh_items():
+        data.append({**item_summary(it), "locked": it.rel_path in claimed})
     return {"items": data}
 
 
+# Claim (or renew the claim on) an item for this session
+@server.post("/api/items/{item_id}/claim")
+def api_item_claim(item_id: int, session: str = Depends(session_id)):
+    claim_or_409(item_by_id(item_id), session)
+    return {"ok": True, "leaseSeconds": LEASE_SECONDS}
+
+
+# Give an item back so other sessions can work on it
+@server.post("/api/items/{item_id}/release")
+def api_item_release(item_id: int, session: str = Depends(session_id)):
+    release_item(item_by_id(item_id).rel_path, session)
+    return {"ok": True}
+
+
 # Return image URLs for a specific item
 @server.get("/api/items/{item_id}/images")
 def api_item_images(item_id: int):
     it = item_by_id(item_id)
     imgs = list_images(it)
-    return {"item": {"id": it.id, "name": it.name}, "images": [f"/media/{p}" for p in imgs]}
+    return {"item": {"id": it.id, "name": it.name}, "images": [f"/media/{p}" for p in imgs], "transcript": load_transcript(it)}
 
 # Return image URLs for a specific item
 @server.get("/api/config/accessibility")
@@ -68,8 +135,8 @@ async def api_audio_upload(item_id: int, file: UploadFile = File(...)):
     ext = Path(file.filename or "note.webm").suffix.lower() or ".webm"
     audio_id = f"{it.id}-{ts}{ext}"
     dest = AUDIO_DIR / audio_id
-    content = await file.read()
-    dest.write_bytes(content)
+    with open(dest, "wb") as f:
+        await run_in_threadpool(shutil.copyfileobj, file.file, f)
 
     # Remove silences from the uploaded audio using ffmpeg
     tmp = dest.with_suffix(dest.suffix + ".tmp.webm")
@@ -77,70 +144,127 @@ async def api_audio_upload(item_id: int, file: UploadFile = File(...)):
     # Replace original file with processed file
     os.replace(tmp, dest)
 
-    # Generate a draft listing using the audio
-    draft = await design_listing(str(dest)) 
+    try:
+        # Transcribe locally if enabled, then generate a draft listing from the transcript or the audio
+        try:
+            transcript = await transcribe(str(dest))
+        except Exception as e:
+            print(f"[warn] Transcription failed, sending the audio instead: {e}", file=sys.stderr)
+            transcript = None
+        # A blank transcript (e.g. VAD dropped everything) is no use to the agent; the audio may still be
+        if not (transcript or "").strip():
+            transcript = None
+        if transcript is not None:
+            save_transcript(it, transcript)
+            draft = await design_listing(transcript=transcript)
+        else:
+            draft = await design_listing(str(dest))
+        emit("draft_ready", itemId=it.id, draft=draft)
+    finally:
+        # delete audio file
+        dest.unlink(missing_ok=True)
+
+    return {"ok": True, "audioId": audio_id, "draft": draft, "transcript": transcript}
+
+
+# Regenerate a draft from the item's (optionally edited) transcript, without re-sending audio
+@server.post("/api/items/{item_id}/draft")
+async def api_item_draft(item_id: int, payload: DraftPayload):
+    it = item_by_id(item_id)
+    transcript = payload.transcript if payload.transcript is not None else load_transcript(it)
+    if not transcript or not transcript.strip():
+        raise HTTPException(status_code=404, detail="No transcript for this item")
+    save_transcript(it, transcript)
+    draft = await design_listing(transcript=transcript)
+    emit("draft_ready", itemId=it.id, draft=draft)
+    return {"ok": True, "draft": draft, "transcript": transcript}
 
-    # delete audio file
-    dest.unlink(missing_ok=True)
 
-    return {"ok": True, "audioId": audio_id, "draft": draft}
+# Start (or look up for resuming) a chunked photo upload into the inbox
+@server.post("/api/uploads")
+def api_upload_create(payload: UploadPayload):
+    return create_upload(payload.name, payload.size, payload.fingerprint, payload.batch)
+
+
+# Current offset of an upload
+@server.get("/api/uploads/{upload_id}")
+def api_upload_status(upload_id: str):
+    return get_upload(upload_id)
+
+
+# Append one chunk, streamed to disk; completed files are grouped into items right away
+@server.patch("/api/uploads/{upload_id}")
+async def api_upload_chunk(upload_id: str, request: Request, upload_offset: int = Header(...), upload_checksum: Optional[str] = Header(None)):
+    meta = await write_chunk(upload_id, upload_offset, request.stream(), upload_checksum)
+    if meta["complete"]:
+        await run_in_threadpool(finish_upload, upload_id)
+    return meta
 
 
 # Submit an item: process image crops, save metadata, and archive input
 @server.post("/api/items/{item_id}/submit")
-def api_submit(item_id: int, payload: SubmitPayload):
+def api_submit(item_id: int, payload: SubmitPayload, session: str = Depends(session_id)):
     it = item_by_id(item_id)
+    claim_or_409(it, session)
 
-    # Prepare ad directory for this item
+    # Crops and YAML are written to a staging dir and moved into place on commit
     ad_dir = (ADS_DIR / it.rel_path)
-    ad_dir.mkdir(parents=True, exist_ok=True)
-
-    # Respect client-provided image order if present
-    ordered_selections = payload.selections
-    if payload.image_order:
-        by_url = {s.url: s for s in payload.selections}
-        ordered_selections = [by_url[u] for u in payload.image_order if u in by_url]
-
-    # Save cropped images
-    cropped_paths: List[Path] = []
-    for idx, sel in enumerate(ordered_selections):
-        if not sel.url.startswith("/media/"):
-            raise HTTPException(status_code=400, detail=f"Invalid media URL: {sel.url}")
-        rel = sel.url[len("/media/") :]
-        src_path = INPUT_DIR / rel
-        if not src_path.exists():
-            raise HTTPException(status_code=404, detail=f"Source image not found: {rel}")
-
-        # Open and crop the image according to selection
-        with Image.open(src_path) as im:
-            im = ImageOps.exif_transpose(im)
-            im = im.convert("RGB")
-            W, H = im.size
-            x = min(max(sel.crop.x, 0.0), 1.0)
-            y = min(max(sel.crop.y, 0.0), 1.0)
-            w = min(max(sel.crop.w, 0.0), 1.0)
-            h = min(max(sel.crop.h, 0.0), 1.0)
-            left = int(round(x * W)); top = int(round(y * H))
-            right = int(round((x + w) * W)); bottom = int(round((y + h) * H))
-            left, top = max(0, left), max(0, top)
-            right, bottom = min(W, right), min(H, bottom)
-            if right <= left or bottom <= top:
-                continue
-            cropped = im.crop((left, top, right, bottom))
-            out_name = f"cropped_{idx+1:02d}.jpg"
-            out_path = ad_dir / out_name
-            cropped.save(out_path, format="JPEG", quality=92, optimize=True)
-            cropped_paths.append(out_path)
-
-    # Write ad metadata to YAML file
-    ad_file = write_ad_yaml(it, dict(payload.metadata or {}), ad_dir)
-
-    # Archive the input folder now
-    archive_input_folder(it)
-
-
-    # Compute next item id if available
-    next_id = it.id + 1 if it.id + 1 < len(ITEMS) else None
+    with Operation("submit", it.rel_path) as op:
+        stage = op.stage_dir()
+
+        # Respect client-provided image order if present
+        ordered_selections = payload.selections
+        if payload.image_order:
+            by_url = {s.url: s for s in payload.selections}
+            ordered_selections = [by_url[u] for u in payload.image_order if u in by_url]
+
+        # Save cropped images
+        cropped_paths: List[Path] = []
+        for idx, sel in enumerate(ordered_selections):
+            emit("crop_progress", itemId=it.id, done=idx, total=len(ordered_selections))
+            if not sel.url.startswith("/media/"):
+                raise HTTPException(status_code=400, detail=f"Invalid media URL: {sel.url}")
+            rel = sel.url[len("/media/") :]
+            src_path = INPUT_DIR / rel
+            if not src_path.exists():
+                raise HTTPException(status_code=404, detail=f"Source image not found: {rel}")
+
+            # Open and crop the image according to selection
+            with Image.open(src_path) as im:
+                im = ImageOps.exif_transpose(im)
+                im = im.convert("RGB")
+                W, H = im.size
+                x = min(max(sel.crop.x, 0.0), 1.0)
+                y = min(max(sel.crop.y, 0.0), 1.0)
+                w = min(max(sel.crop.w, 0.0), 1.0)
+                h = min(max(sel.crop.h, 0.0), 1.0)
+                left = int(round(x * W)); top = int(round(y * H))
+                right = int(round((x + w) * W)); bottom = int(round((y + h) * H))
+                left, top = max(0, left), max(0, top)
+                right, bottom = min(W, right), min(H, bottom)
+                if right <= left or bottom <= top:
+                    continue
+                cropped = im.crop((left, top, right, bottom))
+                out_name = f"cropped_{idx+1:02d}.jpg"
+                cropped.save(stage / out_name, format="JPEG", quality=92, optimize=True)
+                cropped_paths.append(ad_dir / out_name)
+        emit("crop_progress", itemId=it.id, done=len(ordered_selections), total=len(ordered_selections))
+
+        # Write ad metadata to YAML file
+        ad_file = ad_dir / write_ad_yaml(it, dict(payload.metadata or {}), stage).name
+
+        # Replace any previous ad dir, then archive the input folder, all in one operation
+        if ad_dir.exists():
+            op.trash(ad_dir)
+        op.move(stage, ad_dir)
+        archive_input_folder(it, op)
+        op.after_commit(lambda: emit("pending_added", ad=pending_entry(op.resolved(ad_dir) / ad_file.name)))
+
+    release_item(it.rel_path, session)
+
+    # Compute next item id if available, skipping items other sessions are working on
+    claimed = claimed_items(session)
+    next_id = next((x.id for x in refresh_items() if x.name.lower() > it.name.lower() and x.rel_path not in claimed), None)
     return {
         "ok": True,
         "ad_file": str(ad_file),
@@ -155,16 +279,40 @@ def api_pending():
     return {"pending": list_pending_ads()}
 
 
+# Apply one patch to all (or filtered) pending ads
+@server.post("/api/pending/bulk")
+def api_pending_bulk(payload: BulkEditPayload):
+    updated = bulk_patch_pending(payload.patch, payload.unset, payload.dirs, payload.category, payload.title_contains)
+    return {"ok": True, "updated": len(updated), "ads": updated}
+
+
+# Shared ad profile (defaults and description suffix) that all pending ads are rendered from
+@server.get("/api/profile")
+def api_profile():
+    return load_profile()
+
+
+# Replace the profile and re-render all pending ads
+@server.put("/api/profile")
+def api_profile_update(profile: AdProfile):
+    updated = update_profile(profile.model_dump(exclude_none=True))
+    return {"ok": True, "updated": len(updated)}
+
+
 # Publish all pending ads and archive them if successful
 @server.post("/api/publish_all")
 def api_publish_all():
     pending = list_pending_ads()
     if not pending:
         return {"ok": True, "published": False, "message": "No pending ads."}
-    res = run_bulk_publish()
-    pub_ok = (res.returncode == 0)
-    if pub_ok:
-        archive_published_ads()
+    # Only one publish run at a time across all workers, sessions and requests
+    with locked("publish", ttl=PUBLISH_LEASE_SECONDS, wait=False) as held:
+        if not held:
+            return {"ok": False, "published": False, "message": "Another publish is running."}
+        res = run_bulk_publish()
+        pub_ok = (res.returncode == 0)
+        if pub_ok:
+            archive_published_ads()
     return {
         "ok": pub_ok,
         "returncode": res.returncode,
@@ -177,8 +325,7 @@ def api_publish_all():
 # Get archive size and log info
 @server.get("/api/archive/info")
 def api_archive_info():
-    log_size = KLEIN_LOG_PATH.stat().st_size if KLEIN_LOG_PATH.exists() else 0
-    total = _dir_size(ADS_ARCHIVE_DIR) + _dir_size(INPUT_ARCHIVE_DIR) + log_size
+    total = archive_size()
     return {"bytes": total, "human": _format_bytes(total)}
 
 
@@ -187,19 +334,32 @@ def api_archive_info():
 def api_archive_clear():
     _clear_dir_contents(ADS_ARCHIVE_DIR)
     _clear_dir_contents(INPUT_ARCHIVE_DIR)
+    _clear_dir_contents(BLOBS_DIR)
+    _clear_dir_contents(MANIFESTS_DIR)
+    clear_archived_inputs()
     if KLEIN_LOG_PATH.exists():
         try:
             KLEIN_LOG_PATH.unlink()
         except Exception:
             pass
+    emit_archive_size()
     return {"ok": True}
 
 
+# Deduplicate the archive and downscale old entries
+@server.post("/api/archive/compact")
+def api_archive_compact():
+    freed = compact_archive()
+    return {"ok": True, "freed": freed, "human": _format_bytes(freed)}
+
+
 # Archive and delete input for a specific item
 @server.post("/api/items/{item_id}/delete_input")
-def api_delete_input(item_id: int):
+def api_delete_input(item_id: int, session: str = Depends(session_id)):
     it = item_by_id(item_id)
+    claim_or_409(it, session)
     archive_input_folder(it)
+    release_item(it.rel_path, session)
     return {"ok": True}
 
 
@@ -207,8 +367,9 @@ def api_delete_input(item_id: int):
 @server.post("/api/pending/undo")
 def api_pending_undo(payload: UndoPayload):
     rel = payload.dir.strip().strip("/")
-    remove_pending_ad_dir(rel)
-    restored = restore_input_for_rel(rel)
+    with Operation("undo", rel) as op:
+        remove_pending_ad_dir(rel, op)
+        restored = restore_input_for_rel(rel, op)
     return {"ok": True, "restored": restored}
 
 
@@ -221,7 +382,8 @@ def api_pending_undo_all():
         rel = x.get("dir","").strip().strip("/")
         if not rel:
             continue
-        remove_pending_ad_dir(rel)
-        if restore_input_for_rel(rel):
-            restored += 1
-    return {"ok": True, "count": len(entries), "restored": restored}
+        with Operation("undo", rel) as op:
+            remove_pending_ad_dir(rel, op)
+            if restore_input_for_rel(rel, op):
+                restored += 1
+    return {"ok": True, "count": len(entries), "restored": restored}
\ No newline at end of file
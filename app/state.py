@@ -0,0 +1,120 @@
+import sqlite3
+import time
+import uuid
+from contextlib import closing, contextmanager
+from typing import Dict, List, Optional
+
+from app.common import STATE_PATH
+
+# ----------------------------
+# Shared state across server workers and browser sessions
+# ----------------------------
+# Item ids are stable per input folder (instead of list positions), and
+# leases make sure two sessions never work on the same item or publish at
+# the same time. Leases expire, so a closed tab frees its item again.
+
+LEASE_SECONDS = 120
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS item_ids (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    rel TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS kv (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    session TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+"""
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(str(STATE_PATH), timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+
+with closing(_connect()) as _conn:
+    _conn.executescript(_SCHEMA)
+
+
+def item_ids(rels: List[str]) -> Dict[str, int]:
+    with closing(_connect()) as conn, conn:
+        conn.executemany("INSERT OR IGNORE INTO item_ids (rel) VALUES (?)", [(r,) for r in rels])
+        rows = conn.execute("SELECT rel, id FROM item_ids").fetchall()
+    return {rel: id_ for rel, id_ in rows}
+
+
+def get_value(key: str) -> Optional[str]:
+    with closing(_connect()) as conn:
+        row = conn.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def set_value(key: str, value: Optional[str]):
+    with closing(_connect()) as conn, conn:
+        conn.execute("INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)", (key, value))
+
+
+def acquire(name: str, session: str, ttl: float = LEASE_SECONDS) -> bool:
+    # Take or renew a lease; fails if another session holds an unexpired one
+    now = time.time()
+    with closing(_connect()) as conn, conn:
+        conn.execute(
+            "INSERT INTO leases (name, session, expires) VALUES (?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET session = excluded.session, expires = excluded.expires "
+            "WHERE leases.session = excluded.session OR leases.expires < ?",
+            (name, session, now + ttl, now),
+        )
+        row = conn.execute("SELECT session FROM leases WHERE name = ?", (name,)).fetchone()
+    return row is not None and row[0] == session
+
+
+def release(name: str, session: str):
+    with closing(_connect()) as conn, conn:
+        conn.execute("DELETE FROM leases WHERE name = ? AND session = ?", (name, session))
+
+
+@contextmanager
+def locked(name: str, ttl: float = LEASE_SECONDS, poll: float = 0.05, wait: bool = True):
+    # Mutex across server workers and requests (a fresh token each time, so the same
+    # session cannot get it twice). Yields whether it is held; with wait=False it is
+    # not held if someone else has it.
+    token = uuid.uuid4().hex
+    held = acquire(name, token, ttl=ttl)
+    while wait and not held:
+        time.sleep(poll)
+        held = acquire(name, token, ttl=ttl)
+    try:
+        yield held
+    finally:
+        if held:
+            release(name, token)
+
+
+def claim_item(rel: str, session: str) -> bool:
+    # A session works on one item at a time, claiming a new one frees the previous
+    name = f"item:{rel}"
+    if not acquire(name, session):
+        return False
+    with closing(_connect()) as conn, conn:
+        conn.execute("DELETE FROM leases WHERE name LIKE 'item:%' AND session = ? AND name != ?", (session, name))
+    return True
+
+
+def release_item(rel: str, session: str):
+    release(f"item:{rel}", session)
+
+
+def claimed_items(exclude_session: str) -> Dict[str, str]:
+    # rel -> session for all items currently leased by other sessions
+    with closing(_connect()) as conn:
+        rows = conn.execute(
+            "SELECT name, session FROM leases WHERE name LIKE 'item:%' AND session != ? AND expires >= ?",
+            (exclude_session, time.time()),
+        ).fetchall()
+    return {name[len("item:"):]: session for name, session in rows}
@@ -0,0 +1,73 @@
+import asyncio
+import hashlib
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from app.common import TRANSCRIPTS_DIR, get_cfg
+from app.datamodel import Item
+
+try:
+    from faster_whisper import WhisperModel
+except ImportError:
+    WhisperModel = None
+
+# ----------------------------
+# Optional local speech-to-text
+# ----------------------------
+# With `whisper_model` set (and faster-whisper installed), recordings are
+# transcribed on the CPU in a process pool and the agent gets the text instead
+# of the audio. The transcript is cached per item so a draft can be
+# regenerated (e.g. after editing the transcript) without re-sending audio.
+# Transcripts are keyed by a hash of the item's rel path; when an item is
+# archived its transcript moves along, so a later item reusing the folder
+# name starts without one and an undo gets the original back.
+
+WHISPER_MODEL = get_cfg("whisper_model")
+WHISPER_LANGUAGE = get_cfg("whisper_language", "de")
+WHISPER_WORKERS = int(get_cfg("whisper_workers", 1))
+
+_model = None
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def transcription_enabled() -> bool:
+    return bool(WHISPER_MODEL) and WhisperModel is not None
+
+
+def _transcribe_file(audio_path: str) -> str:
+    # Runs in a pool process; the model is loaded once per process
+    global _model
+    if _model is None:
+        _model = WhisperModel(WHISPER_MODEL, device="cpu", compute_type="int8")
+    segments, _ = _model.transcribe(audio_path, language=WHISPER_LANGUAGE, vad_filter=True)
+    return " ".join(s.text.strip() for s in segments).strip()
+
+
+async def transcribe(audio_path: str) -> Optional[str]:
+    global _pool
+    if not transcription_enabled():
+        return None
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=WHISPER_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return await asyncio.get_running_loop().run_in_executor(_pool, _transcribe_file, audio_path)
+
+
+def _transcript_path(key: str):
+    return TRANSCRIPTS_DIR / f"{hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]}.txt"
+
+
+def load_transcript(item: Item) -> Optional[str]:
+    p = _transcript_path(item.rel_path)
+    return p.read_text(encoding="utf-8") if p.exists() else None
+
+
+def save_transcript(item: Item, transcript: str):
+    _transcript_path(item.rel_path).write_text(transcript, encoding="utf-8")
+
+
+def move_transcript(src_key: str, dst_key: str):
+    src = _transcript_path(src_key)
+    if src.exists():
+        os.replace(src, _transcript_path(dst_key))
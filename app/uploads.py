@@ -0,0 +1,153 @@
+import asyncio
+import base64
+import binascii
+import hashlib
+import json
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import AsyncIterator, Dict, Optional
+
+from fastapi import HTTPException
+from starlette.requests import ClientDisconnect
+
+from app.common import IMAGE_EXTS, INBOX_DIR, UPLOADS_DIR
+from app.input import ingest_image
+from app.state import acquire, get_value, locked, release, set_value
+
+# ----------------------------
+# Resumable chunked uploads (tus-like)
+# ----------------------------
+# A client creates an upload (name, size, fingerprint) and sends PATCH requests
+# with Upload-Offset and an optional "Upload-Checksum: sha256 <base64>" header.
+# Chunks are streamed to UPLOADS_DIR/<id>.part; the current offset is simply
+# the size of that file, so an interrupted upload resumes where it stopped.
+# Finished files go through the inbox into separator detection and grouping,
+# in the order in which they complete (the UI uploads them in name order).
+# Each upload belongs to a batch (one drop/selection in the UI); grouping
+# continues within a batch only, so a new batch never extends an old item.
+
+# Renewed while a chunk streams; only expires if the worker writing it died
+CHUNK_LEASE_SECONDS = 60
+
+
+def _paths(upload_id: str):
+    if not upload_id.isalnum():
+        raise HTTPException(status_code=400, detail="Invalid upload id")
+    return UPLOADS_DIR / f"{upload_id}.json", UPLOADS_DIR / f"{upload_id}.part"
+
+
+def get_upload(upload_id: str) -> Dict:
+    meta_path, part_path = _paths(upload_id)
+    if not meta_path.exists():
+        raise HTTPException(status_code=404, detail="Upload not found")
+    meta = json.loads(meta_path.read_text(encoding="utf-8"))
+    meta["offset"] = part_path.stat().st_size if part_path.exists() else 0
+    return meta
+
+
+def create_upload(name: str, size: int, fingerprint: str, batch: str) -> Dict:
+    name = Path(name).name
+    if Path(name).suffix.lower() not in IMAGE_EXTS:
+        raise HTTPException(status_code=400, detail=f"Not an image: {name}")
+    if size <= 0:
+        raise HTTPException(status_code=400, detail="Invalid size")
+    if not batch.isalnum():
+        raise HTTPException(status_code=400, detail="Invalid batch id")
+    # Same file from the same client -> same upload, so it can be resumed
+    upload_id = hashlib.sha256(f"{fingerprint}\0{name}\0{size}".encode("utf-8")).hexdigest()[:32]
+    meta_path, part_path = _paths(upload_id)
+    if not part_path.exists():
+        part_path.touch()
+    # A resumed upload joins the batch it is resumed in
+    meta_path.write_text(json.dumps({"id": upload_id, "name": name, "size": size, "batch": batch}), encoding="utf-8")
+    return get_upload(upload_id)
+
+
+def _parse_checksum(header: Optional[str]) -> Optional[bytes]:
+    if not header:
+        return None
+    algo, _, value = header.partition(" ")
+    if algo.lower() != "sha256":
+        raise HTTPException(status_code=400, detail=f"Unsupported checksum algorithm: {algo}")
+    try:
+        return base64.b64decode(value, validate=True)
+    except binascii.Error:
+        raise HTTPException(status_code=400, detail="Invalid checksum")
+
+
+def _fsync(f):
+    f.flush()
+    os.fsync(f.fileno())
+
+
+async def write_chunk(upload_id: str, offset: int, stream: AsyncIterator[bytes], checksum: Optional[str]) -> Dict:
+    _, part_path = _paths(upload_id)
+    expected = _parse_checksum(checksum)
+    # One writer per upload: a request the client gave up on may still be streaming
+    lease, token = f"upload:{upload_id}", uuid.uuid4().hex
+    if not await asyncio.to_thread(acquire, lease, token, CHUNK_LEASE_SECONDS):
+        raise HTTPException(status_code=423, detail="Another request is writing to this upload")
+    try:
+        meta = await asyncio.to_thread(get_upload, upload_id)
+        if offset != meta["offset"]:
+            raise HTTPException(status_code=409, detail=f"Offset mismatch, server has {meta['offset']}")
+        if offset >= meta["size"]:
+            raise HTTPException(status_code=409, detail="Upload already complete")
+
+        # Stream straight to disk (off the event loop); a rejected chunk is cut off again so
+        # the offset stays valid, but bytes of an interrupted one are kept, as in tus
+        h = hashlib.sha256()
+        end = offset
+        renewed = time.monotonic()
+        f = await asyncio.to_thread(open, part_path, "r+b")
+        try:
+            f.seek(offset)
+            try:
+                async for data in stream:
+                    if end + len(data) > meta["size"]:
+                        raise HTTPException(status_code=413, detail="Chunk exceeds upload size")
+                    await asyncio.to_thread(f.write, data)
+                    end += len(data)
+                    h.update(data)
+                    if time.monotonic() - renewed > CHUNK_LEASE_SECONDS / 3:
+                        await asyncio.to_thread(acquire, lease, token, CHUNK_LEASE_SECONDS)
+                        renewed = time.monotonic()
+                if expected is not None and h.digest() != expected:
+                    raise HTTPException(status_code=460, detail="Checksum mismatch")
+            except HTTPException:
+                await asyncio.to_thread(f.truncate, offset)
+                raise
+            except ClientDisconnect:
+                pass
+            await asyncio.to_thread(_fsync, f)
+        finally:
+            f.close()
+    finally:
+        await asyncio.to_thread(release, lease, token)
+
+    meta["offset"] = end
+    meta["complete"] = end == meta["size"]
+    return meta
+
+
+def finish_upload(upload_id: str) -> Optional[str]:
+    # Move the completed file into the inbox and feed it into grouping right away
+    meta = get_upload(upload_id)
+    meta_path, part_path = _paths(upload_id)
+    INBOX_DIR.mkdir(parents=True, exist_ok=True)
+    name = Path(meta["name"])
+    dest = INBOX_DIR / name
+    n = 1
+    while dest.exists():
+        dest = INBOX_DIR / f"{name.stem}_{n}{name.suffix}"
+        n += 1
+    os.replace(part_path, dest)
+    meta_path.unlink(missing_ok=True)
+    # The group lives in shared state, so serialize across workers, not just threads
+    key = f"upload_group:{meta['batch']}"
+    with locked("ingest", ttl=60):
+        target_dir = ingest_image(str(dest), get_value(key))
+        set_value(key, target_dir)
+    return target_dir
@@ -0,0 +1,78 @@
+"""
+Bulk-edit throughput: list/patch N pending ads via the index vs. re-reading every YAML.
+
+Usage (from the repository root, with config.yaml set up):
+    python -m benchmarks.bulk_patch [n_ads]
+
+Runs in a temporary work dir, so the real .work/ is not touched. The naive
+side runs the same parse/render/write code (same C YAML loader/dumper) with
+the index left out, so the difference is only the parsing the index saves.
+"""
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# WORK_DIR is resolved relative to the cwd on import
+_tmp = tempfile.TemporaryDirectory()
+os.chdir(_tmp.name)
+
+from app.ad_template import apply_patch, load_profile, render_ad  # noqa: E402
+from app.common import ADS_DIR  # noqa: E402
+from app.datamodel import Item  # noqa: E402
+from app.kleinanzeigen import (  # noqa: E402
+    _entry, _parse_ad, _write_ad_files, bulk_patch_pending, find_ad_files, list_pending_ads, write_ad_yaml,
+)
+
+
+# The naive variants are the same code paths without the index: every ad is parsed on every call
+def _naive_list():
+    profile = load_profile()
+    return [_entry(_parse_ad(ad, profile)) for ad in find_ad_files(ADS_DIR)]
+
+
+def _naive_patch(patch: dict, category: str = "", title_contains: str = ""):
+    profile = load_profile()
+    for ad in find_ad_files(ADS_DIR):
+        _, fname, _, overrides, data = _parse_ad(ad, profile)
+        if not str(data.get("category", "")).startswith(category):
+            continue
+        if title_contains not in str(data.get("title", "")).lower():
+            continue
+        new_overrides = apply_patch(overrides, patch, [])
+        _write_ad_files(ad.parent, fname, new_overrides, render_ad(new_overrides, profile, data))
+
+
+def _timed(label: str, fn, *args):
+    t0 = time.perf_counter()
+    fn(*args)
+    print(f"{label:<34} {time.perf_counter() - t0:7.3f}s")
+
+
+def main(n: int):
+    for i in range(n):
+        name = f"item_{i:05d}"
+        md = {
+            "title": f"Gebrauchter Artikel Nummer {i}",
+            "description": "Guter Zustand, wenig benutzt. " * 5,
+            "category": "161/172/cd_player" if i % 2 else "80/91",
+            "price": 10 + i % 50,
+            "shipping_options": ["DHL_2", "Hermes_Päckchen"],
+            "contact": {"zipcode": "10115"},
+        }
+        write_ad_yaml(Item(id=i, name=name, rel_path=name, abs_path=Path(name)), md, ADS_DIR / name)
+
+    # Indexed runs first: the naive rewrites change every mtime and would invalidate the index
+    _timed(f"index build ({n} ads)", list_pending_ads)
+    _timed("list (indexed)", list_pending_ads)
+    _timed("patch 1% by title (indexed)", bulk_patch_pending, {"price": 99}, [], None, None, "nummer 12")
+    _timed("patch half by category (indexed)", bulk_patch_pending, {"shipping_costs": 4.99}, [], None, "161/")
+    _timed("patch all (indexed)", bulk_patch_pending, {"contact": {"phone": "0170 1234567"}}, [])
+    _timed("list (naive)", _naive_list)
+    _timed("patch 1% by title (naive)", _naive_patch, {"price": 98}, "", "nummer 12")
+    _timed("patch half by category (naive)", _naive_patch, {"shipping_costs": 5.99}, "161/")
+    _timed("patch all (naive)", _naive_patch, {"contact": {"phone": "0170 7654321"}})
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
@@ -0,0 +1,69 @@
+"""
+End-to-end draft latency: audio input vs. local transcript input.
+
+Usage (from the repository root, with config.yaml set up):
+    python -m benchmarks.draft_latency path/to/note.webm [runs]
+
+Each run mirrors /api/audio: strip silence, then either send the audio to the
+agent or transcribe locally and send the text. A final row shows regenerating
+a draft from the cached transcript, which skips audio processing entirely.
+"""
+import asyncio
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from app.design_listing import design_listing
+from app.helpers import strip_silence_ffmpegpy
+from app.transcribe import transcribe, transcription_enabled
+
+
+async def _timed(coro_fn, runs: int):
+    times = []
+    result = None
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        result = await coro_fn()
+        times.append(time.perf_counter() - t0)
+    return times, result
+
+
+def _report(label: str, times):
+    print(f"{label:<28} median {statistics.median(times):6.2f}s  min {min(times):6.2f}s  max {max(times):6.2f}s")
+
+
+async def main(audio_path: str, runs: int):
+    if not transcription_enabled():
+        sys.exit("Set whisper_model in config.yaml and install faster-whisper to compare against transcripts.")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        stripped = str(Path(tmp) / "note.webm")
+
+        async def audio_draft():
+            strip_silence_ffmpegpy(audio_path, stripped)
+            return await design_listing(stripped)
+
+        async def transcript_draft():
+            strip_silence_ffmpegpy(audio_path, stripped)
+            return await transcribe(stripped)
+
+        # Warm up the whisper pool so model loading is not counted
+        strip_silence_ffmpegpy(audio_path, stripped)
+        await transcribe(stripped)
+
+        audio_times, _ = await _timed(audio_draft, runs)
+        stt_times, transcript = await _timed(transcript_draft, runs)
+        llm_times, _ = await _timed(lambda: design_listing(transcript=transcript), runs)
+
+    _report("audio -> LLM", audio_times)
+    _report("audio -> STT -> LLM", [a + b for a, b in zip(stt_times, llm_times)])
+    _report("  of which local STT", stt_times)
+    _report("cached transcript -> LLM", llm_times)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit(__doc__)
+    asyncio.run(main(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 3))